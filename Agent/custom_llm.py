@@ -1,9 +1,52 @@
 # agent/custom_llm.py
 
-import json
+import asyncio
+import weakref
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from langchain.llms.base import LLM
-from typing import Optional, List
+from typing import Optional, List, Union
+
+# Shared keep-alive session so repeated generations reuse pooled TCP connections
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.1)
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# One async client per event loop, since pooled connections cannot cross loops.
+# Whoever owns a loop should call aclose_async_client() before the loop ends.
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async HTTP client for the running event loop,
+    creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+async def aclose_async_client():
+    """
+    Closes the running loop's async HTTP client and its pooled connections.
+    """
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
 
 class OllamaLLM(LLM):
     """
@@ -19,30 +62,49 @@ class OllamaLLM(LLM):
     def _llm_type(self) -> str:
         return "ollama_llm"
 
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        payload = {
+    def _payload(self, prompt: str) -> dict:
+        return {
             "prompt": prompt,
             "model": self.model,
             "temperature": self.temperature
         }
 
+    @staticmethod
+    def _parse_line(line: Union[bytes, str]) -> str:
         try:
-            response = requests.post(f"{self.endpoint_url}/generate", json=payload, timeout=300)
-            response.raise_for_status()
+            line_data = orjson.loads(line)
+            return line_data.get("content", "")
+        except orjson.JSONDecodeError:
+            # In case there's a stray line we can't parse as JSON
+            return line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        output_lines = []
+        try:
+            with _SESSION.post(
+                f"{self.endpoint_url}/generate", json=self._payload(prompt), timeout=300, stream=True
+            ) as response:
+                response.raise_for_status()
+                # Consume NDJSON chunks as Ollama emits them instead of buffering the body
+                for line in response.iter_lines():
+                    if line:
+                        output_lines.append(self._parse_line(line))
         except requests.exceptions.RequestException as e:
             raise ValueError(f"Error calling Ollama: {e}")
 
+        return "".join(output_lines)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None) -> str:
         output_lines = []
-        for line in response.text.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                line_data = json.loads(line)
-                content = line_data.get("content", "")
-                output_lines.append(content)
-            except json.JSONDecodeError:
-                # In case there's a stray line we can't parse as JSON
-                output_lines.append(line)
+        try:
+            async with get_async_client().stream(
+                "POST", f"{self.endpoint_url}/generate", json=self._payload(prompt), timeout=300
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        output_lines.append(self._parse_line(line))
+        except httpx.HTTPError as e:
+            raise ValueError(f"Error calling Ollama: {e}")
 
         return "".join(output_lines)
@@ -12,28 +12,33 @@ Last Updated: 2024-01-16
 """
 
 import os
+import sys
+import math
 import time
 import asyncio
 import logging
+import threading
 import importlib
 import ast
-from typing import List, Dict, Optional, Any, Union, Tuple
+from typing import List, ClassVar, Deque, Dict, FrozenSet, Optional, Any, Sequence, Union, Tuple
+from array import array
+from collections import deque
 from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import datetime
-from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from itertools import compress, islice
 
 # Third-party imports
 from langchain.agents import initialize_agent, AgentType, Tool
 from langchain.llms import OpenAI, BaseLLM
 from langchain.memory import ConversationBufferMemory
-from langchain.callbacks import BaseCallbackHandler
+from langchain.callbacks.base import BaseCallbackHandler
 
 # Local imports
-from agent.custom_llm import OllamaLLM
+from agent.custom_llm import OllamaLLM, aclose_async_client
 from agent.tools.file_tools import read_file, write_file
-from agent.tools.code_tools import run_python_code
+from agent.tools.code_tools import PythonWorkerPool
 from agent.utils.performance_tracker import PerformanceTracker
 from agent.utils.safety_validator import SafetyValidator
 from agent.config import load_config
@@ -41,24 +46,42 @@ from agent.config import load_config
 # Load configuration
 CONFIG = load_config()
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, CONFIG.get('LOG_LEVEL', 'INFO')),
-    format='%(asctime)s 🤖 %(levelname)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Configure logging (handlers and format are set up once in the package __init__)
 logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, CONFIG.get('LOG_LEVEL', 'INFO')))
 
-@dataclass
+# Wall-clock offset of the perf_counter epoch, used to turn monotonic
+# timestamps into datetimes only when stats are exported
+_PERF_COUNTER_EPOCH_NS = time.time_ns() - time.perf_counter_ns()
+
+def _perf_ns_to_datetime(timestamp_ns: int) -> datetime:
+    """Convert a perf_counter_ns() reading to a local datetime"""
+    return datetime.fromtimestamp((_PERF_COUNTER_EPOCH_NS + timestamp_ns) / 1e9)
+
+@dataclass(slots=True)
 class RequestMetrics:
     """Detailed metrics for a single request"""
-    start_time: datetime
-    end_time: Optional[datetime] = None
-    duration: Optional[float] = None
+    start_ns: int
+    end_ns: Optional[int] = None
     success: bool = False
     error: Optional[str] = None
 
-@dataclass
+    @property
+    def duration(self) -> Optional[float]:
+        """Request duration in seconds, once the request has finished"""
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def start_time(self) -> datetime:
+        return _perf_ns_to_datetime(self.start_ns)
+
+    @property
+    def end_time(self) -> Optional[datetime]:
+        return _perf_ns_to_datetime(self.end_ns) if self.end_ns is not None else None
+
+@dataclass(slots=True)
 class AgentMetrics:
     """Enhanced agent performance metrics"""
     total_requests: int = 0
@@ -66,85 +89,203 @@ class AgentMetrics:
     failed_requests: int = 0
     average_response_time: float = 0.0
     last_error: Optional[str] = None
-    last_activity: Optional[datetime] = None
-    request_history: List[RequestMetrics] = field(default_factory=list)
+    last_activity_ns: Optional[int] = None
+    # Bounded so long-running agents keep a fixed-size window of recent requests
+    request_history: Deque[RequestMetrics] = field(
+        default_factory=lambda: deque(maxlen=CONFIG.get('METRICS_HISTORY', 256))
+    )
+    _total_response_time: float = field(default=0.0, repr=False)
+    # Callbacks run on executor threads under arun, so history access is locked
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
     
     def add_request(self, metrics: RequestMetrics):
         """Add request metrics with thread safety"""
-        self.request_history.append(metrics)
-        self.total_requests += 1
-        
-        if metrics.success:
-            self.successful_requests += 1
-            if metrics.duration is not None:
-                if self.successful_requests == 1:
-                    self.average_response_time = metrics.duration
-                else:
-                    self.average_response_time = (
-                        (self.average_response_time * (self.successful_requests - 1) + metrics.duration)
-                        / self.successful_requests
-                    )
-        else:
-            self.failed_requests += 1
-            self.last_error = metrics.error
+        with self._lock:
+            self.request_history.append(metrics)
+            self.total_requests += 1
             
-        self.last_activity = metrics.end_time or metrics.start_time
+            if metrics.success:
+                self.successful_requests += 1
+                if metrics.duration is not None:
+                    self._total_response_time += metrics.duration
+                    self.average_response_time = self._total_response_time / self.successful_requests
+            else:
+                self.failed_requests += 1
+                self.last_error = metrics.error
+                
+            self.last_activity_ns = metrics.end_ns or metrics.start_ns
+
+    def recent_requests(self, limit: int = 10) -> List[RequestMetrics]:
+        """Snapshot of the most recent requests, oldest first"""
+        with self._lock:
+            recent = list(islice(reversed(self.request_history), limit))
+        recent.reverse()
+        return recent
+
+    def add_request_batch(
+        self,
+        durations: Sequence[float],
+        successes: Sequence[bool],
+        errors: Optional[Sequence[Optional[str]]] = None,
+        last_activity_ns: Optional[int] = None
+    ):
+        """
+        Fold a batch of finished requests into the aggregate counters.
+        
+        Reductions run over contiguous array/bytes buffers in C; individual
+        entries are not added to request_history (see add_requests).
+        last_activity_ns defaults to now when the caller has no end timestamps.
+        """
+        durations = array('d', durations)
+        flags = bytes(map(bool, successes))
+        if len(durations) != len(flags) or (errors is not None and len(errors) != len(flags)):
+            raise ValueError("durations, successes and errors must have the same length")
+        
+        with self._lock:
+            self._fold_batch(durations, flags, errors, last_activity_ns)
+
+    def add_requests(self, requests: Sequence[RequestMetrics]):
+        """Record finished requests in history and fold them into the counters as one batch"""
+        durations = array('d', (request.duration or 0.0 for request in requests))
+        flags = bytes(bool(request.success) for request in requests)
+        errors = [request.error for request in requests]
+        end_times = [request.end_ns or request.start_ns for request in requests]
+        with self._lock:
+            self.request_history.extend(requests)
+            self._fold_batch(durations, flags, errors, max(end_times, default=None))
+
+    def _fold_batch(
+        self,
+        durations: array,
+        flags: bytes,
+        errors: Optional[Sequence[Optional[str]]],
+        last_activity_ns: Optional[int]
+    ):
+        """Update the counters from a validated batch; caller holds the lock"""
+        succeeded = flags.count(1)
+        self.total_requests += len(flags)
+        self.successful_requests += succeeded
+        self.failed_requests += len(flags) - succeeded
+        if succeeded:
+            self._total_response_time += math.fsum(compress(durations, flags))
+            self.average_response_time = self._total_response_time / self.successful_requests
+        if errors is not None and succeeded < len(flags):
+            self.last_error = next(
+                error for error, ok in zip(reversed(errors), reversed(flags)) if not ok
+            )
+        if flags:
+            self.last_activity_ns = last_activity_ns or time.perf_counter_ns()
+
+    @property
+    def last_activity(self) -> Optional[datetime]:
+        if self.last_activity_ns is None:
+            return None
+        return _perf_ns_to_datetime(self.last_activity_ns)
 
 class EnhancedPerformanceCallback(BaseCallbackHandler):
     """Thread-safe performance monitoring with detailed metrics"""
     
     def __init__(self, metrics: AgentMetrics):
         self.metrics = metrics
-        self._current_request: Optional[RequestMetrics] = None
-        self._lock = asyncio.Lock()
+        # In-flight requests keyed by LangChain run_id, so concurrent runs don't clash
+        self._active_requests: Dict[Any, RequestMetrics] = {}
+        self._lock = threading.Lock()
 
-    async def on_llm_start(self, *args, **kwargs):
+    def on_llm_start(self, *args, **kwargs):
         """Handle LLM start with thread safety"""
-        async with self._lock:
-            self._current_request = RequestMetrics(
-                start_time=datetime.now()
+        with self._lock:
+            self._active_requests[kwargs.get("run_id")] = RequestMetrics(
+                start_ns=time.perf_counter_ns()
             )
 
-    async def on_llm_end(self, *args, **kwargs):
+    def on_llm_end(self, *args, **kwargs):
         """Handle successful LLM completion"""
-        if self._current_request:
-            async with self._lock:
-                self._current_request.end_time = datetime.now()
-                self._current_request.duration = (
-                    self._current_request.end_time - self._current_request.start_time
-                ).total_seconds()
-                self._current_request.success = True
-                self.metrics.add_request(self._current_request)
-                self._current_request = None
-
-    async def on_llm_error(self, error: Union[str, Exception], *args, **kwargs):
+        with self._lock:
+            request = self._active_requests.pop(kwargs.get("run_id"), None)
+            if request:
+                request.end_ns = time.perf_counter_ns()
+                request.success = True
+                self._record(request)
+
+    def on_llm_error(self, error: Union[str, Exception], *args, **kwargs):
         """Handle LLM errors with detailed tracking"""
-        if self._current_request:
-            async with self._lock:
-                self._current_request.end_time = datetime.now()
-                self._current_request.success = False
-                self._current_request.error = str(error)
-                self.metrics.add_request(self._current_request)
-                self._current_request = None
+        with self._lock:
+            request = self._active_requests.pop(kwargs.get("run_id"), None)
+            if request:
+                request.end_ns = time.perf_counter_ns()
+                request.success = False
+                request.error = str(error)
+                self._record(request)
+
+    def _record(self, request: RequestMetrics):
+        """Store a finished request; called with the callback lock held"""
+        self.metrics.add_request(request)
+
+class _BatchPerformanceCallback(EnhancedPerformanceCallback):
+    """Collects a batch's finished requests so they are recorded in one go"""
+    
+    def __init__(self, metrics: AgentMetrics):
+        super().__init__(metrics)
+        self.finished: List[RequestMetrics] = []
+
+    def _record(self, request: RequestMetrics):
+        self.finished.append(request)
+
+    def snapshot(self) -> List[RequestMetrics]:
+        """Copy of the requests finished so far"""
+        with self._lock:
+            return list(self.finished)
+
+class _BlockedNodeFound(Exception):
+    """Raised by the validator visitor to stop at the first blocked node"""
+
+class _SecurityVisitor(ast.NodeVisitor):
+    """Single-pass AST visitor that bails out on the first blocked construct"""
+
+    def __init__(self, blocked_imports: FrozenSet[str], blocked_attributes: FrozenSet[str]):
+        self.blocked_imports = blocked_imports
+        self.blocked_attributes = blocked_attributes
+
+    def visit_Import(self, node: ast.Import):
+        for name in node.names:
+            if sys.intern(name.name.partition('.')[0]) in self.blocked_imports:
+                raise _BlockedNodeFound(f"Blocked import: {name.name}")
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if node.attr in self.blocked_attributes:
+            raise _BlockedNodeFound(f"Blocked attribute: {node.attr}")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Name) and node.func.id in self.blocked_attributes:
+            raise _BlockedNodeFound(f"Blocked function call: {node.func.id}")
+        self.generic_visit(node)
 
 class CodeValidator:
     """Advanced Python code validation and security checking"""
     
-    BLOCKED_IMPORTS = {
+    # Interned so membership checks against AST identifiers can short-circuit on identity
+    BLOCKED_IMPORTS: ClassVar[FrozenSet[str]] = frozenset(map(sys.intern, (
         'os', 'subprocess', 'sys', 'builtins', 'shutil',
         'pickle', 'marshal', 'base64', 'codecs'
-    }
+    )))
     
-    BLOCKED_ATTRIBUTES = {
+    BLOCKED_ATTRIBUTES: ClassVar[FrozenSet[str]] = frozenset(map(sys.intern, (
         'eval', 'exec', 'compile', '__import__', 'open',
         'file', 'execfile', 'input', 'raw_input'
-    }
+    )))
 
     @classmethod
+    @lru_cache(maxsize=CONFIG.get('VALIDATION_CACHE_SIZE', 512))
     def validate_code(cls, code: str) -> Tuple[bool, Optional[str]]:
         """
         Thoroughly validate Python code for security concerns.
         
+        Results are memoized per code string, so agents resubmitting the
+        same snippet skip re-parsing.
+        
         Returns:
             Tuple[bool, Optional[str]]: (is_safe, error_message)
         """
@@ -152,32 +293,109 @@ class CodeValidator:
             # Parse the code into an AST
             tree = ast.parse(code)
             
-            # Check for dangerous imports and attributes
-            for node in ast.walk(tree):
-                # Check imports
-                if isinstance(node, (ast.Import, ast.ImportFrom)):
-                    for name in node.names:
-                        if name.name.split('.')[0] in cls.BLOCKED_IMPORTS:
-                            return False, f"Blocked import: {name.name}"
-                
-                # Check attribute access
-                elif isinstance(node, ast.Attribute):
-                    if node.attr in cls.BLOCKED_ATTRIBUTES:
-                        return False, f"Blocked attribute: {node.attr}"
-                
-                # Check calls to dangerous functions
-                elif isinstance(node, ast.Call):
-                    if isinstance(node.func, ast.Name):
-                        if node.func.id in cls.BLOCKED_ATTRIBUTES:
-                            return False, f"Blocked function call: {node.func.id}"
-            
+            # Check for dangerous imports, attributes and calls in one pass
+            _SecurityVisitor(cls.BLOCKED_IMPORTS, cls.BLOCKED_ATTRIBUTES).visit(tree)
             return True, None
             
+        except _BlockedNodeFound as e:
+            return False, str(e)
         except SyntaxError as e:
             return False, f"Invalid syntax: {str(e)}"
         except Exception as e:
             return False, f"Validation error: {str(e)}"
 
+# Shared, lazily built components. Only memory and metrics are per-agent, so
+# creating several AgentCore instances (tests, batch eval) reuses these.
+_COMPONENT_LOCK = threading.Lock()
+
+_LLM_CACHE: Dict[Any, BaseLLM] = {}
+_LLM_CACHE_SIZE = 8
+
+@lru_cache(maxsize=None)
+def _get_python_worker() -> PythonWorkerPool:
+    """
+    Process-wide pool of persistent interpreters for validated code snippets.
+    A hung snippet ties up one worker for up to CODE_TIMEOUT; the others keep serving.
+    """
+    return PythonWorkerPool(
+        size=CONFIG.get('CODE_WORKERS', 2),
+        timeout=CONFIG.get('CODE_TIMEOUT', 30)
+    )
+
+def _run_validated_python_code(code: str) -> str:
+    """Validate a snippet and run it in the shared Python worker pool"""
+    is_safe, error_message = CodeValidator.validate_code(code)
+    if not is_safe:
+        return f"⚠️ Code validation failed: {error_message}"
+    try:
+        return _get_python_worker().run(code)
+    except Exception as e:
+        return f"❌ Error executing code: {str(e)}"
+
+def _as_coroutine(func):
+    """Wrap a blocking tool function so async agents run it off the event loop"""
+    async def _run(tool_input: str) -> str:
+        return await asyncio.to_thread(func, tool_input)
+    return _run
+
+def _freeze(value: Any) -> Any:
+    """Recursively turn dicts/lists/sets into hashable equivalents for cache keys"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+# Settings OllamaLLM actually accepts; anything else in model_config is OpenAI-only
+_OLLAMA_SETTINGS = frozenset(('endpoint_url', 'model', 'temperature'))
+
+def _llm_settings(use_ollama: bool, model_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce model_config to the settings the chosen backend will use"""
+    if not use_ollama:
+        return model_config
+    ignored = sorted(key for key in model_config if key not in _OLLAMA_SETTINGS)
+    if ignored:
+        logger.warning("Ollama backend ignores unsupported model settings: %s", ", ".join(ignored))
+    return {key: value for key, value in model_config.items() if key in _OLLAMA_SETTINGS}
+
+def _create_llm(use_ollama: bool, settings: Dict[str, Any]) -> BaseLLM:
+    if use_ollama:
+        return OllamaLLM(**settings)
+    return OpenAI(**settings)
+
+def _build_llm(use_ollama: bool, model_config: Dict[str, Any]) -> BaseLLM:
+    """
+    Build the LLM once per (backend, effective settings) pair.
+    Configs that can't be turned into a hashable key are built uncached.
+    """
+    settings = _llm_settings(use_ollama, model_config)
+    try:
+        key = (use_ollama, _freeze(settings))
+        hash(key)
+    except TypeError:
+        return _create_llm(use_ollama, settings)
+    
+    llm = _LLM_CACHE.get(key)
+    if llm is None:
+        if len(_LLM_CACHE) >= _LLM_CACHE_SIZE:
+            _LLM_CACHE.pop(next(iter(_LLM_CACHE)))
+        llm = _LLM_CACHE[key] = _create_llm(use_ollama, settings)
+    return llm
+
+@lru_cache(maxsize=None)
+def _build_tools() -> Tuple[Tool, ...]:
+    """Build the stateless tool set shared by all agents"""
+    return (
+        Tool(
+            name="run_python_code",
+            func=_run_validated_python_code,
+            coroutine=_as_coroutine(_run_validated_python_code),
+            description="Run a Python snippet after security validation. Input is the code."
+        ),
+    )
+
 class AgentCore:
     """Enhanced AI Agent Core with robust async support and safety features"""
 
@@ -207,6 +425,7 @@ class AgentCore:
         
         # Initialize components
         self.metrics = AgentMetrics()
+        self.performance_callback = EnhancedPerformanceCallback(self.metrics)
         self.performance_tracker = PerformanceTracker()
         self.code_validator = CodeValidator()
         self._initialize_components()
@@ -217,37 +436,32 @@ class AgentCore:
         """Initialize all agent components with error handling"""
         try:
             self.memory = ConversationBufferMemory(**self.memory_config)
-            self.tools = []
-            self.llm = None
-            self.agent = None
-            self._executor = ThreadPoolExecutor(max_workers=CONFIG.get('MAX_WORKERS', 3))
             
-            self._build_llm()
-            self._build_tools()
-            self._build_agent()
+            with _COMPONENT_LOCK:
+                self._python_worker = _get_python_worker()
+                self.llm = _build_llm(self.use_ollama, self.model_config)
+                self.tools = list(_build_tools())
+            
+            self.agent = self._build_agent()
             
         except Exception as e:
-            logger.error(f"Failed to initialize agent components: {e}")
+            logger.error("Failed to initialize agent components: %s", e)
             raise
 
+    def _build_agent(self):
+        """Build the per-instance agent executor around the shared LLM and tools"""
+        return initialize_agent(
+            self.tools,
+            self.llm,
+            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+            memory=self.memory,
+            verbose=CONFIG.get('VERBOSE', False)
+        )
+
     async def _safe_run_python_code(self, code: str) -> str:
         """Enhanced safe Python code execution with thorough validation"""
-        is_safe, error_message = self.code_validator.validate_code(code)
-        
-        if not is_safe:
-            return f"⚠️ Code validation failed: {error_message}"
-        
-        try:
-            # Run code in a separate thread to prevent blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self._executor,
-                run_python_code,
-                code
-            )
-            return result
-        except Exception as e:
-            return f"❌ Error executing code: {str(e)}"
+        # Worker pipe I/O blocks, so hand it to the default thread pool
+        return await asyncio.to_thread(_run_validated_python_code, code)
 
     async def run(self, prompt: str) -> str:
         """
@@ -255,23 +469,78 @@ class AgentCore:
         
         This method properly handles async operations without nested event loops.
         """
+        return await self._run_with_agent(self.agent, prompt)
+
+    async def _run_with_agent(
+        self,
+        agent,
+        prompt: str,
+        callback: Optional[BaseCallbackHandler] = None
+    ) -> str:
+        """Run a single prompt through the given agent executor"""
         if not prompt or not isinstance(prompt, str):
             raise ValueError("🤔 I need a valid prompt to help you!")
         
         try:
-            # Run agent in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                self._executor,
-                self.agent.run,
-                prompt
+            # Native async run, so concurrent tasks overlap at the HTTP layer
+            response = await agent.arun(
+                prompt, callbacks=[callback or self.performance_callback]
             )
             return f"✨ {response}"
             
         except Exception as e:
-            logger.error(f"Error running agent: {e}")
+            logger.error("Error running agent: %s", e)
             raise
 
+    async def run_batch_async(
+        self,
+        prompts: List[str],
+        concurrency: Optional[int] = None
+    ) -> List[Union[str, Exception]]:
+        """
+        Run several prompts concurrently, at most `concurrency` at a time.
+        
+        Each prompt gets its own conversation memory so answers don't leak
+        between prompts. Failures are returned in place of the response.
+        LLM metrics for the whole batch are recorded once it finishes.
+        """
+        semaphore = asyncio.Semaphore(concurrency or CONFIG.get('MAX_WORKERS', 3))
+        batch_callback = _BatchPerformanceCallback(self.metrics)
+
+        async def _run_one(prompt: str) -> str:
+            async with semaphore:
+                isolated_agent = self.agent.copy(
+                    update={"memory": ConversationBufferMemory(**self.memory_config)}
+                )
+                return await self._run_with_agent(isolated_agent, prompt, batch_callback)
+
+        try:
+            return await asyncio.gather(
+                *(_run_one(prompt) for prompt in prompts),
+                return_exceptions=True
+            )
+        finally:
+            self.metrics.add_requests(batch_callback.snapshot())
+
+    def run_batch(
+        self,
+        prompts: List[str],
+        concurrency: Optional[int] = None
+    ) -> List[Union[str, Exception]]:
+        """Synchronous wrapper around run_batch_async for scripts and tests"""
+        async def _run_and_close():
+            # This call owns the event loop, so release its HTTP pool before it ends
+            try:
+                return await self.run_batch_async(prompts, concurrency)
+            finally:
+                await aclose_async_client()
+
+        return asyncio.run(_run_and_close())
+
+    async def aclose(self):
+        """Release the async HTTP client bound to the running event loop"""
+        await aclose_async_client()
+
     def get_performance_stats(self) -> Dict[str, Any]:
         """Get comprehensive performance statistics"""
         stats = {
@@ -292,7 +561,7 @@ class AgentCore:
         }
         
         # Add recent request details
-        for req in self.metrics.request_history[-10:]:  # Last 10 requests
+        for req in self.metrics.recent_requests(10):  # Last 10 requests
             stats["recent_requests"].append({
                 "timestamp": req.start_time.strftime("%Y-%m-%d %H:%M:%S"),
                 "duration": f"{req.duration:.2f}s" if req.duration else None,
@@ -342,7 +611,8 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"😅 Error: {str(e)}")
         finally:
-            agent._executor.shutdown(wait=True)
+            await agent.aclose()
+            agent._python_worker.close()
 
     # Run with proper async handling
     if asyncio.get_event_loop().is_running():
@@ -0,0 +1,127 @@
+# agent/tools/python_worker.py
+
+"""
+Long-lived Python worker used by PythonWorker in code_tools.
+
+Reads length-prefixed code frames ("{len}\n{code}") from stdin, executes each
+snippet in a fresh globals dict, and answers with three length-prefixed frames:
+the captured stdout, the captured stderr, and a recycle flag (b"1" when the
+worker is about to exit so the parent should start a fresh one).
+
+Common stdlib modules are imported up front so typical snippets don't grow
+sys.modules. The worker recycles itself after a snippet that imports any other
+module, rebinds a global of an already-loaded module (e.g. `json.dumps = None`
+or patching builtins), or after a fixed number of snippets (first command-line
+argument, default 100).
+"""
+
+import contextlib
+import io
+import os
+import sys
+import traceback
+
+# Safe, commonly used stdlib modules loaded before the baseline snapshot
+PRELOADED_MODULES = (
+    "bisect", "collections", "copy", "dataclasses", "datetime", "decimal",
+    "fractions", "functools", "heapq", "itertools", "json", "math", "operator",
+    "random", "re", "statistics", "string", "textwrap", "typing",
+)
+
+# Private references, so snippets patching modules or builtins can't break the protocol
+_StringIO = io.StringIO
+_redirect_stdout = contextlib.redirect_stdout
+_redirect_stderr = contextlib.redirect_stderr
+_print_exception = traceback.print_exception
+_exc_info = sys.exc_info
+_compile = compile
+_exec = exec
+_int = int
+_len = len
+_id = id
+_repr = repr
+_modules = sys.modules
+
+def _read_frame(stream) -> bytes:
+    header = stream.readline()
+    if not header:
+        raise EOFError
+    return stream.read(_int(header))
+
+def _write_frame(stream, payload: bytes):
+    stream.write(b"%d\n" % _len(payload))
+    stream.write(payload)
+
+def _snapshot_globals(module_names):
+    """Identity snapshot of each module's globals, to detect later rebinding"""
+    return [
+        (module.__dict__, {name: _id(value) for name, value in module.__dict__.items()})
+        for module_name in module_names
+        if module_name not in ("sys", "__main__")
+        for module in (_modules[module_name],)
+    ]
+
+def _globals_changed(snapshot) -> bool:
+    for namespace, ids in snapshot:
+        if _len(namespace) != _len(ids):
+            return True
+        for name, value in namespace.items():
+            if ids.get(name) != _id(value):
+                return True
+    return False
+
+def _run_snippet(code: str):
+    stdout, stderr = _StringIO(), _StringIO()
+    with _redirect_stdout(stdout), _redirect_stderr(stderr):
+        try:
+            _exec(_compile(code, "<snippet>", "exec"), {"__name__": "__main__"})
+        except BaseException:
+            # Drop the worker's own frame so the traceback starts at the snippet
+            etype, value, tb = _exc_info()
+            try:
+                _print_exception(etype, value, tb.tb_next)
+            except BaseException:
+                stderr.write(f"{etype.__name__}: {_repr(value)}\n")
+    return stdout.getvalue(), stderr.getvalue()
+
+def main():
+    max_snippets = _int(sys.argv[1]) if _len(sys.argv) > 1 else 100
+
+    # Keep private handles on the real stdin/stdout for the protocol. fd 0 is
+    # pointed at /dev/null and fd 1 at stderr, so snippets touching the raw
+    # descriptors (or closing sys.stdin, as exit()/quit() do) cannot break frames
+    requests_in = os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+    responses_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, sys.stdin.fileno())
+    os.close(devnull)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for module_name in PRELOADED_MODULES:
+        __import__(module_name)
+    baseline_modules = frozenset(_modules)
+    baseline_globals = _snapshot_globals(baseline_modules)
+
+    for snippet_count in range(1, max_snippets + 1):
+        try:
+            code = _read_frame(requests_in).decode("utf-8")
+        except (EOFError, ValueError):
+            return
+
+        sys.stdin = _StringIO()
+        stdout, stderr = _run_snippet(code)
+
+        recycle = (
+            snippet_count == max_snippets
+            or not baseline_modules.issuperset(_modules)
+            or _globals_changed(baseline_globals)
+        )
+        _write_frame(responses_out, stdout.encode("utf-8", errors="replace"))
+        _write_frame(responses_out, stderr.encode("utf-8", errors="replace"))
+        _write_frame(responses_out, b"1" if recycle else b"0")
+        responses_out.flush()
+        if recycle:
+            return
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,172 @@
 # agent/tools/code_tools.py
 
+import os
+import queue
 import subprocess
-import tempfile
+import sys
+import threading
+from typing import Optional
 
 def run_python_code(code: str) -> str:
     """
-    Runs a Python code snippet in a temporary file and returns stdout/stderr.
+    Runs a Python code snippet in an isolated interpreter and returns stdout/stderr.
     """
-    with tempfile.NamedTemporaryFile(mode='w', suffix=".py", delete=False) as tmp_file:
-        file_name = tmp_file.name
-        tmp_file.write(code)
-    
     try:
+        # Feed the code on stdin ("-") so snippet size isn't bound by the argv limit,
+        # and force UTF-8 stdio since -I makes the child ignore PYTHONIOENCODING
         result = subprocess.run(
-            ["python", file_name],
+            [sys.executable, "-I", "-X", "utf8", "-"],
+            input=code.encode("utf-8"),
             capture_output=True,
-            text=True,
             timeout=30
         )
-        output = result.stdout if result.stdout else ""
-        errors = result.stderr if result.stderr else ""
-        return f"Output:\n{output}\nErrors:\n{errors}"
+        output = b"Output:\n" + result.stdout + b"\nErrors:\n" + result.stderr
+        return output.decode("utf-8", errors="replace")
     except Exception as e:
         return f"Error running code: {e}"
-    finally:
-        # If you want to delete the temp file after, you could do so here
-        pass
+
+class PythonWorker:
+    """
+    Persistent interpreter that runs snippets without paying process startup per call.
+    Hung snippets are killed by a watchdog timer and the worker is respawned.
+
+    Each snippet gets fresh globals. Common stdlib modules (math, json, random,
+    ...) are preloaded so importing them is free; the worker is replaced after
+    any snippet that imports anything else, rebinds an attribute of a loaded
+    module, and after `max_snippets` runs. If the worker died between snippets,
+    the request is retried once on a fresh one.
+    """
+
+    WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_worker.py")
+
+    def __init__(self, timeout: float = 30, max_snippets: int = 100):
+        self.timeout = timeout
+        self.max_snippets = max_snippets
+        self._lock = threading.Lock()
+        # Start the interpreter now so the first snippet doesn't pay for startup
+        self._process: Optional[subprocess.Popen] = self._spawn()
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            [sys.executable, "-I", "-u", self.WORKER_SCRIPT, str(self.max_snippets)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    def _ensure_process(self) -> subprocess.Popen:
+        if self._process is not None and self._process.poll() is not None:
+            self._reap(self._process)
+            self._process = None
+        if self._process is None:
+            self._process = self._spawn()
+        return self._process
+
+    @staticmethod
+    def _reap(process: subprocess.Popen):
+        process.wait()
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read_frame(stream) -> bytes:
+        header = stream.readline()
+        if not header:
+            raise EOFError("Python worker exited")
+        return stream.read(int(header))
+
+    def _send(self, payload: bytes) -> Optional[subprocess.Popen]:
+        """
+        Writes a request frame, retrying once on a fresh worker if the current one
+        had already died, so a crashed worker never costs an innocent snippet.
+        """
+        for _ in range(2):
+            process = self._ensure_process()
+            try:
+                process.stdin.write(payload)
+                process.stdin.flush()
+                return process
+            except OSError:
+                process.kill()
+                self._reap(process)
+                self._process = None
+        return None
+
+    def run(self, code: str) -> str:
+        """
+        Runs a Python code snippet in the worker and returns stdout/stderr.
+        """
+        encoded = code.encode("utf-8")
+        payload = b"%d\n" % len(encoded) + encoded
+        with self._lock:
+            process = self._send(payload)
+            if process is None:
+                return "Error running code: Python worker could not be started"
+            watchdog = threading.Timer(self.timeout, process.kill)
+            watchdog.start()
+            try:
+                stdout = self._read_frame(process.stdout)
+                stderr = self._read_frame(process.stdout)
+                recycle = self._read_frame(process.stdout) == b"1"
+            except (OSError, EOFError, ValueError) as e:
+                process.kill()
+                self._reap(process)
+                self._process = self._spawn()
+                if watchdog.finished.is_set():
+                    return f"Error running code: timed out after {self.timeout} seconds"
+                return f"Error running code: {e}"
+            finally:
+                watchdog.cancel()
+
+            if recycle:
+                self._reap(process)
+                self._process = self._spawn()
+
+        output = b"Output:\n" + stdout + b"\nErrors:\n" + stderr
+        return output.decode("utf-8", errors="replace")
+
+    def close(self):
+        """
+        Stops the worker process if it is running.
+        """
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                self._reap(self._process)
+            self._process = None
+
+class PythonWorkerPool:
+    """
+    Fixed set of PythonWorkers shared by concurrent callers, so one hung snippet
+    only ties up a single worker until its timeout fires.
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 30):
+        self._workers = [PythonWorker(timeout=timeout) for _ in range(max(1, size))]
+        self._idle: "queue.Queue[PythonWorker]" = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def run(self, code: str) -> str:
+        """
+        Runs a Python code snippet on the next idle worker and returns stdout/stderr.
+        """
+        worker = self._idle.get()
+        try:
+            return worker.run(code)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """
+        Stops every worker process in the pool.
+        """
+        for worker in self._workers:
+            worker.close()
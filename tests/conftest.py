@@ -0,0 +1,50 @@
+# tests/conftest.py
+
+"""
+Test bootstrap for the `agent` package.
+
+The sources import themselves as `agent.*`, which only resolves to the `Agent/`
+directory on case-insensitive filesystems, and `Agent/__init__.py` pulls in the
+empty `Agent/agent_core.py`. Register `agent` as a package rooted at `Agent/`
+without running its `__init__`, point `agent.agent_core` at the real module in
+`Agent/src/`, and provide the config/utils modules it expects but that are not
+part of the tree.
+"""
+
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parents[1] / "Agent"
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+class _PerformanceTracker:
+    """Placeholder for agent.utils.performance_tracker.PerformanceTracker"""
+
+class _SafetyValidator:
+    """Placeholder for agent.utils.safety_validator.SafetyValidator"""
+
+def _bootstrap_agent_package():
+    if "agent" in sys.modules:
+        return
+
+    _module("agent", __path__=[str(PACKAGE_DIR)])
+    _module("agent.config", load_config=lambda: {})
+    _module("agent.utils", __path__=[])
+    _module("agent.utils.performance_tracker", PerformanceTracker=_PerformanceTracker)
+    _module("agent.utils.safety_validator", SafetyValidator=_SafetyValidator)
+
+    spec = importlib.util.spec_from_file_location(
+        "agent.agent_core", PACKAGE_DIR / "src" / "agent_core.py"
+    )
+    agent_core = importlib.util.module_from_spec(spec)
+    sys.modules["agent.agent_core"] = agent_core
+    spec.loader.exec_module(agent_core)
+
+_bootstrap_agent_package()
@@ -0,0 +1,57 @@
+# tests/test_agent_metrics.py
+
+import time
+import unittest
+
+from agent.agent_core import AgentMetrics, RequestMetrics
+
+class TestAgentMetrics(unittest.TestCase):
+    """Test cases for aggregate request metrics"""
+
+    def setUp(self):
+        self.metrics = AgentMetrics()
+
+    def test_batch_mixed_success_average(self):
+        """Only successful durations count toward the average"""
+        self.metrics.add_request_batch(
+            [1.0, 2.0, 3.0, 9.0],
+            [True, True, True, False],
+            [None, None, None, "boom"]
+        )
+        self.assertEqual(self.metrics.total_requests, 4)
+        self.assertEqual(self.metrics.successful_requests, 3)
+        self.assertEqual(self.metrics.failed_requests, 1)
+        self.assertAlmostEqual(self.metrics.average_response_time, 2.0)
+        self.assertEqual(self.metrics.last_error, "boom")
+        self.assertIsNotNone(self.metrics.last_activity)
+
+    def test_batch_combines_with_single_requests(self):
+        """Batch and per-request ingestion share one running average"""
+        request = RequestMetrics(start_ns=time.perf_counter_ns())
+        request.end_ns = request.start_ns + 4_000_000_000
+        request.success = True
+        self.metrics.add_request(request)
+        self.metrics.add_request_batch([1.0, 1.0], [True, True])
+        self.assertAlmostEqual(self.metrics.average_response_time, 2.0)
+
+    def test_batch_length_mismatch(self):
+        """Mismatched input lengths are rejected without touching the counters"""
+        with self.assertRaises(ValueError):
+            self.metrics.add_request_batch([1.0, 2.0], [True])
+        with self.assertRaises(ValueError):
+            self.metrics.add_request_batch([1.0], [False], ["a", "b"])
+        self.assertEqual(self.metrics.total_requests, 0)
+
+    def test_add_requests_records_history(self):
+        """add_requests keeps per-request history alongside the batch aggregates"""
+        start = time.perf_counter_ns()
+        ok = RequestMetrics(start_ns=start, end_ns=start + 1_000_000_000, success=True)
+        failed = RequestMetrics(start_ns=start, end_ns=start, success=False, error="timeout")
+        self.metrics.add_requests([ok, failed])
+        self.assertEqual(self.metrics.recent_requests(), [ok, failed])
+        self.assertEqual(self.metrics.last_error, "timeout")
+        self.assertAlmostEqual(self.metrics.average_response_time, 1.0)
+        self.assertEqual(self.metrics.last_activity_ns, start + 1_000_000_000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# tests/test_code_tools.py
+
+import threading
+import unittest
+
+from agent.tools.code_tools import PythonWorker, PythonWorkerPool, run_python_code
+
+class TestRunPythonCode(unittest.TestCase):
+    """Test cases for the one-shot code runner"""
+
+    def test_large_snippet(self):
+        """Snippets beyond the command-line length limit still run"""
+        code = "x = 1\n" * 40_000 + "print(x)"
+        self.assertEqual(run_python_code(code), "Output:\n1\n\nErrors:\n")
+
+    def test_non_ascii_output(self):
+        """Output is produced and decoded as UTF-8"""
+        self.assertEqual(run_python_code("print('héllo ✨')"), "Output:\nhéllo ✨\n\nErrors:\n")
+
+class TestPythonWorker(unittest.TestCase):
+    """Test cases for the persistent Python worker"""
+
+    def setUp(self):
+        self.worker = PythonWorker(timeout=2)
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_normal_run(self):
+        """Captures stdout and stderr of a snippet"""
+        result = self.worker.run("import sys\nprint('hello')\nprint('oops', file=sys.stderr)")
+        self.assertEqual(result, "Output:\nhello\n\nErrors:\noops\n")
+
+    def test_exception_traceback(self):
+        """Reports the snippet traceback without the worker's own frame"""
+        result = self.worker.run("1 / 0")
+        self.assertIn('File "<snippet>", line 1', result)
+        self.assertIn("ZeroDivisionError", result)
+        self.assertNotIn("python_worker.py", result)
+
+    def test_timeout_then_successful_run(self):
+        """Kills a hung snippet and serves the next one from a fresh worker"""
+        self.assertIn("timed out", self.worker.run("while True: pass"))
+        self.assertEqual(self.worker.run("print(1)"), "Output:\n1\n\nErrors:\n")
+
+    def test_oversized_output(self):
+        """Frames larger than the pipe buffer arrive intact"""
+        result = self.worker.run("print('x' * 1_000_000)")
+        self.assertEqual(result, "Output:\n" + "x" * 1_000_000 + "\n\nErrors:\n")
+        self.assertEqual(self.worker.run("print(2)"), "Output:\n2\n\nErrors:\n")
+
+    def test_exit_and_quit_do_not_break_worker(self):
+        """exit()/quit() close sys.stdin, which must not be the protocol pipe"""
+        for snippet in ("exit(3)", "quit()"):
+            self.assertIn("SystemExit", self.worker.run(snippet))
+            self.assertEqual(self.worker.run("print(1)"), "Output:\n1\n\nErrors:\n")
+
+    def test_module_state_does_not_leak(self):
+        """A snippet that patches an imported module doesn't affect later snippets"""
+        self.worker.run("import json\njson.dumps = None")
+        self.assertNotIn("None", self.worker.run("import json\nprint(json.dumps)"))
+
+    def test_patched_io_does_not_break_next_snippet(self):
+        """Patching io.StringIO doesn't stop the worker from capturing output"""
+        self.worker.run("import io\nio.StringIO = None")
+        self.assertIn("1", self.worker.run("print(1)"))
+
+    def test_patched_builtins_do_not_break_framing(self):
+        """Patching builtins doesn't corrupt the protocol or hang the next caller"""
+        self.worker.run("__builtins__['len'] = None")
+        self.assertIn("Output:\n1", self.worker.run("print(1)"))
+
+    def test_preloaded_import_keeps_worker(self):
+        """Importing a common stdlib module doesn't recycle the worker"""
+        pid = self.worker._process.pid
+        self.worker.run("import math, json, random\nprint(math.pi)")
+        self.assertEqual(self.worker._process.pid, pid)
+
+    def test_dead_worker_is_retried(self):
+        """A worker that died between snippets is replaced before the request is lost"""
+        self.worker._process.kill()
+        self.worker._process.wait()
+        self.assertIn("Output:\n1", self.worker.run("print(1)"))
+
+class TestPythonWorkerPool(unittest.TestCase):
+    """Test cases for the shared worker pool"""
+
+    def setUp(self):
+        self.pool = PythonWorkerPool(size=2, timeout=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_hung_snippet_does_not_block_other_callers(self):
+        """A second caller is served while the first snippet is hung"""
+        hung = threading.Thread(target=self.pool.run, args=("while True: pass",))
+        hung.start()
+        self.assertEqual(self.pool.run("print(1)"), "Output:\n1\n\nErrors:\n")
+        self.assertTrue(hung.is_alive())
+        hung.join()
+
+if __name__ == "__main__":
+    unittest.main()